@@ -19,17 +19,26 @@ from flask import (
     g,
     redirect,
     url_for,
-    render_template_string,
+    render_template,
     Response,
+    make_response,
     session,
     flash,
 )
+from jinja2 import ChoiceLoader, DictLoader, FileSystemBytecodeCache
+from markupsafe import Markup, escape
 import sqlite3
 from pathlib import Path
 import csv
-from io import StringIO
+from io import StringIO, TextIOWrapper
 from datetime import datetime
+from contextlib import contextmanager
 import os
+import hashlib
+import hmac
+import itertools
+import time
+import zlib
 
 # ---------------- CONFIG ----------------
 DB_PATH = Path(__file__).parent / "customers.db"
@@ -37,6 +46,9 @@ app = Flask(__name__)
 app.config["DATABASE"] = str(DB_PATH)
 app.secret_key = os.environ.get("LEDGER_SECRET", "change_this_secret")
 ADMIN_PASSWORD = os.environ.get("LEDGER_PASS", "changeme")
+# fixed-size digest so login can use a constant-time compare
+_ADMIN_HASH = hashlib.sha256(ADMIN_PASSWORD.encode()).digest()
+IMPORT_BATCH_SIZE = 1000
 
 # ----------------- TEMPLATE -----------------
 TEMPLATE = """
@@ -126,27 +138,14 @@ TEMPLATE = """
         <div class="card">
           <div class="card-body">
             <h5 class="card-title">Customers</h5>
-            {% if customers %}
+            {% if rows_html %}
             <div class="table-responsive">
               <table class="table table-striped">
                 <thead>
                   <tr><th>#</th><th>Name</th><th>Phone</th><th class="text-end">Balance</th><th>Actions</th></tr>
                 </thead>
                 <tbody>
-                  {% for c in customers %}
-                    <tr>
-                      <td>{{ loop.index }}</td>
-                      <td>{{ c['name'] }}</td>
-                      <td>{{ c['phone'] or '-' }}</td>
-                      <td class="text-end">{{ '%.2f'|format(c['balance']) }}</td>
-                      <td>
-                        <a class="btn btn-sm btn-outline-primary" href="/customer/{{ c['id'] }}">View</a>
-                        <form method="post" action="/delete_customer/{{ c['id'] }}" style="display:inline-block;">
-                          <button class="btn btn-sm btn-danger" onclick="return confirm('Delete customer and transactions?')">Delete</button>
-                        </form>
-                      </td>
-                    </tr>
-                  {% endfor %}
+                  {{ rows_html }}
                 </tbody>
               </table>
             </div>
@@ -182,7 +181,7 @@ TEMPLATE = """
               <div class="card-body">
                 <h4>{{ customer['name'] }}</h4>
                 <p class="mb-1"><strong>Phone:</strong> {{ customer['phone'] or '-' }}</p>
-                <p class="mb-1"><strong>Balance:</strong> {{ '%.2f'|format(customer['balance']) }}</p>
+                <p class="mb-1"><strong>Balance:</strong> {{ customer['balance_str'] }}</p>
               </div>
             </div>
 
@@ -216,7 +215,7 @@ TEMPLATE = """
                           <td>{{ loop.index }}</td>
                           <td>{{ t['created_at'] }}</td>
                           <td>{{ t['type'] }}</td>
-                          <td class="text-end">{{ '%.2f'|format(t['amount']) }}</td>
+                          <td class="text-end">{{ t['amount_str'] }}</td>
                           <td>{{ t['note'] or '' }}</td>
                         </tr>
                       {% endfor %}
@@ -239,15 +238,62 @@ TEMPLATE = """
 </html>
 """
 
+# Dashboard customer row, filled with str.format in index() rather than a Jinja loop so large
+# tables skip per-node template dispatch. Values must be escaped by the caller.
+ROW_TMPL = """
+                    <tr>
+                      <td>{i}</td>
+                      <td>{name}</td>
+                      <td>{phone}</td>
+                      <td class="text-end">{balance}</td>
+                      <td>
+                        <a class="btn btn-sm btn-outline-primary" href="/customer/{id}">View</a>
+                        <form method="post" action="/delete_customer/{id}" style="display:inline-block;">
+                          <button class="btn btn-sm btn-danger" onclick="return confirm('Delete customer and transactions?')">Delete</button>
+                        </form>
+                      </td>
+                    </tr>"""
+
+# Serve TEMPLATE through a loader so Jinja's template cache keeps the compiled version between
+# requests, and persist the bytecode so debug reloads don't have to re-parse it either.
+app.jinja_loader = ChoiceLoader([loader for loader in (app.jinja_loader, DictLoader({'ledger.html': TEMPLATE})) if loader is not None])
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+
+
+def render_page(page, **context):
+    return render_template('ledger.html', page=page, **context)
+
 # ----------------- DB UTILITIES -----------------
 
+# Per-connection settings, applied on every connect. journal_mode=WAL is stored in the database
+# file and is set once by init_db().
+SQLITE_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA foreign_keys=ON',
+)
+
+def _apply_pragmas(db):
+    for pragma in SQLITE_PRAGMAS:
+        db.execute(pragma)
+
+
+def connect_db():
+    # autocommit; multi-statement writes go through write_transaction()
+    db = sqlite3.connect(app.config["DATABASE"], isolation_level=None)
+    db.row_factory = sqlite3.Row
+    _apply_pragmas(db)
+    return db
+
+
 def get_db():
     db = getattr(g, "_database", None)
     if db is None:
-        db = g._database = sqlite3.connect(app.config["DATABASE"])
-        db.row_factory = sqlite3.Row
+        db = g._database = connect_db()
     return db
 
+# Closed when the request context ends, which for a streamed response is before the body is read;
+# streaming generators must open (and close) their own connection with connect_db().
 @app.teardown_appcontext
 def close_db(exception):
     db = getattr(g, "_database", None)
@@ -255,14 +301,54 @@ def close_db(exception):
         db.close()
 
 
+@contextmanager
+def write_transaction(db):
+    """Run the block inside BEGIN IMMEDIATE ... COMMIT, rolling back if it raises."""
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        yield db
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    db.execute('COMMIT')
+
+
+# Bumped after every committed write; the dashboard ETag is derived from it so unchanged
+# data can be answered with 304 without querying. The seed keeps tags from matching across restarts.
+_data_versions = itertools.count(1)
+DATA_VERSION = 0
+_ETAG_SEED = f"{os.getpid():x}.{int(time.time()):x}"
+
+
+def bump_data_version():
+    global DATA_VERSION
+    DATA_VERSION = next(_data_versions)
+
+
+def create_transactions_table(cur, name='transactions'):
+    cur.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+            amount REAL NOT NULL,
+            type TEXT NOT NULL,
+            note TEXT,
+            created_at TEXT NOT NULL
+        )
+    ''')
+
+
 def init_db():
     """Create tables and perform safe automatic migrations if needed."""
     db = sqlite3.connect(app.config["DATABASE"])
     cur = db.cursor()
+    # persistent: switches the database file to write-ahead logging for all later connections
+    cur.execute('PRAGMA journal_mode=WAL')
 
     # If customers table exists, check for missing 'phone' and existing 'amount' column to migrate
     cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='customers'")
     exists = cur.fetchone()
+    backfill = False
 
     if exists:
         # inspect columns
@@ -273,54 +359,94 @@ def init_db():
             print("Adding missing 'phone' column to customers table...")
             cur.execute("ALTER TABLE customers ADD COLUMN phone TEXT")
             db.commit()
+        # add stored balance column if missing; filled from transactions below
+        if 'balance' not in cols:
+            print("Adding missing 'balance' column to customers table...")
+            cur.execute("ALTER TABLE customers ADD COLUMN balance REAL NOT NULL DEFAULT 0")
+            db.commit()
+            backfill = True
         # if old schema had 'amount' column, migrate values into transactions
         if 'amount' in cols:
-            print("Old 'amount' column detected — migrating to transactions...")
             # ensure transactions table exists
+            create_transactions_table(cur)
+            # move positive amounts -> debit, negative -> credit; customers that already have a
+            # 'migrated' transaction are skipped so restarting doesn't migrate them again
+            now = datetime.utcnow().isoformat()
             cur.execute('''
-                CREATE TABLE IF NOT EXISTS transactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    customer_id INTEGER NOT NULL,
-                    amount REAL NOT NULL,
-                    type TEXT NOT NULL,
-                    note TEXT,
-                    created_at TEXT NOT NULL
-                )
-            ''')
-            # move positive amounts -> debit, negative -> credit
-            cur.execute('SELECT id, amount FROM customers')
-            rows = cur.fetchall()
-            for r in rows:
-                cid, amt = r
-                if amt is None:
-                    continue
-                if amt == 0:
-                    continue
-                ttype = 'debit' if amt > 0 else 'credit'
-                now = datetime.utcnow().isoformat()
-                cur.execute('INSERT INTO transactions (customer_id, amount, type, note, created_at) VALUES (?,?,?,?,?)', (cid, abs(amt), ttype, 'migrated', now))
+                INSERT INTO transactions (customer_id, amount, type, note, created_at)
+                SELECT id, abs(amount), CASE WHEN amount > 0 THEN 'debit' ELSE 'credit' END, 'migrated', ?
+                FROM customers WHERE amount IS NOT NULL AND amount <> 0
+                AND NOT EXISTS (SELECT 1 FROM transactions t WHERE t.customer_id = customers.id AND t.note = 'migrated')
+            ''', (now,))
             # Note: removing a column in SQLite is complex — we leave the column but future code ignores it
+            if cur.rowcount > 0:
+                print(f"Old 'amount' column detected — migrated {cur.rowcount} amounts to transactions")
+                backfill = True
             db.commit()
-            db.close()
-            return
-    # If customers table does not exist, create fresh schema
+    # Create any missing tables (fresh install, or transactions after a phone-only migration)
     cur.execute('''
         CREATE TABLE IF NOT EXISTS customers (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
-            phone TEXT
+            phone TEXT,
+            balance REAL NOT NULL DEFAULT 0
         )
     ''')
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            customer_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            type TEXT NOT NULL,
-            note TEXT,
-            created_at TEXT NOT NULL
-        )
+    create_transactions_table(cur)
+    # transactions tables created before the foreign key existed are rebuilt with it so deleting a
+    # customer cascades; rows pointing at missing customers can't satisfy it and are dropped
+    if not cur.execute('PRAGMA foreign_key_list(transactions)').fetchall():
+        print("Adding foreign key to transactions table...")
+        cur.execute('BEGIN')
+        create_transactions_table(cur, 'transactions_new')
+        cur.execute('''
+            INSERT INTO transactions_new
+            SELECT id, customer_id, amount, type, note, created_at FROM transactions
+            WHERE customer_id IN (SELECT id FROM customers)
+        ''')
+        kept = cur.rowcount
+        orphans = cur.execute('SELECT COUNT(*) FROM transactions').fetchone()[0] - kept
+        if orphans:
+            print(f"Dropped {orphans} transactions with no matching customer")
+        cur.execute('DROP TABLE transactions')
+        cur.execute('ALTER TABLE transactions_new RENAME TO transactions')
+        db.commit()
+    if backfill:
+        cur.execute('''
+            UPDATE customers SET balance = (
+                SELECT COALESCE(SUM(CASE type WHEN 'debit' THEN amount ELSE -amount END), 0)
+                FROM transactions WHERE customer_id = customers.id
+            )
+        ''')
+    # a customer's transactions for the detail page and exports, already in date order
+    cur.execute('DROP INDEX IF EXISTS idx_txn_customer')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_txn_customer_created ON transactions(customer_id, created_at)')
+    # search goes through customers_fts below; these B-tree indexes were never used by it
+    cur.execute('DROP INDEX IF EXISTS idx_cust_name')
+    cur.execute('DROP INDEX IF EXISTS idx_cust_phone')
+    db.commit()
+    # trigram full-text index over name/phone for dashboard substring search, kept in sync by triggers
+    cur.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='customers_fts'")
+    fts = cur.fetchone()
+    if fts and 'trigram' not in fts[0]:
+        # built by an earlier version with the word tokenizer, which only matched word prefixes
+        cur.execute('DROP TABLE customers_fts')
+        fts = None
+    cur.executescript('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS customers_fts USING fts5(name, phone, content='customers', content_rowid='id', tokenize='trigram');
+        CREATE TRIGGER IF NOT EXISTS customers_fts_ai AFTER INSERT ON customers BEGIN
+            INSERT INTO customers_fts(rowid, name, phone) VALUES (new.id, new.name, new.phone);
+        END;
+        CREATE TRIGGER IF NOT EXISTS customers_fts_ad AFTER DELETE ON customers BEGIN
+            INSERT INTO customers_fts(customers_fts, rowid, name, phone) VALUES ('delete', old.id, old.name, old.phone);
+        END;
+        CREATE TRIGGER IF NOT EXISTS customers_fts_au AFTER UPDATE OF name, phone ON customers BEGIN
+            INSERT INTO customers_fts(customers_fts, rowid, name, phone) VALUES ('delete', old.id, old.name, old.phone);
+            INSERT INTO customers_fts(rowid, name, phone) VALUES (new.id, new.name, new.phone);
+        END;
     ''')
+    if not fts:
+        cur.execute("INSERT INTO customers_fts(customers_fts) VALUES ('rebuild')")
     db.commit()
     db.close()
 
@@ -334,9 +460,9 @@ def require_login():
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'GET':
-        return render_template_string(TEMPLATE, page='login')
+        return render_page('login')
     pw = request.form.get('password', '')
-    if pw == ADMIN_PASSWORD:
+    if hmac.compare_digest(_ADMIN_HASH, hashlib.sha256(pw.encode()).digest()):
         session['logged_in'] = True
         flash('Logged in')
         return redirect(url_for('index'))
@@ -352,34 +478,47 @@ def logout():
 
 # ----------------- HELPERS -----------------
 
-def compute_balance(db, customer_id):
-    cur = db.execute('SELECT amount, type FROM transactions WHERE customer_id = ?', (customer_id,))
-    total = 0.0
-    for r in cur.fetchall():
-        amt = r['amount']
-        if r['type'] == 'debit':
-            total += amt
-        else:
-            total -= amt
-    return total
+# Formatted customer balance for every query that shows one. Balances are running float sums;
+# round(...) + 0.0 turns a tiny negative residue into 0.00 rather than -0.00.
+BALANCE_STR_SQL = "printf('%.2f', round(balance, 2) + 0.0) AS balance_str"
+
+def fts_query(q):
+    """Quote search input as a single FTS5 phrase; on the trigram index that is a substring match."""
+    return '"%s"' % q.replace('"', '""')
 
 # ----------------- ROUTES -----------------
 
 @app.route('/')
 def index():
     q = request.args.get('q', '').strip()
+    etag = f"{_ETAG_SEED}-{DATA_VERSION}-{int(require_login())}-{zlib.crc32(q.encode()):x}"
+    # pending flash messages must still be rendered even if the data is unchanged
+    if '_flashes' not in session and request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag, weak=True)
+        return resp
     db = get_db()
-    if q:
-        cur = db.execute("SELECT id, name, phone FROM customers WHERE name LIKE ? OR phone LIKE ? ORDER BY id DESC", (f"%{q}%", f"%{q}%"))
+    # the trigram index needs at least three characters; shorter input falls back to LIKE
+    if len(q) >= 3:
+        cur = db.execute(
+            f"SELECT c.id, c.name, c.phone, {BALANCE_STR_SQL} "
+            "FROM customers_fts f JOIN customers c ON c.id = f.rowid "
+            "WHERE customers_fts MATCH ? ORDER BY c.id DESC",
+            (fts_query(q),),
+        )
+    elif q:
+        cur = db.execute(f"SELECT id, name, phone, {BALANCE_STR_SQL} FROM customers WHERE name LIKE ? OR phone LIKE ? ORDER BY id DESC", (f"%{q}%", f"%{q}%"))
     else:
-        cur = db.execute('SELECT id, name, phone FROM customers ORDER BY id DESC')
-    rows = [dict(r) for r in cur.fetchall()]
-    customers = []
-    for r in rows:
-        r['balance'] = compute_balance(db, r['id'])
-        customers.append(r)
+        cur = db.execute(f"SELECT id, name, phone, {BALANCE_STR_SQL} FROM customers ORDER BY id DESC")
+    rows_html = Markup(''.join(
+        ROW_TMPL.format(i=i, id=c['id'], name=escape(c['name']), phone=escape(c['phone'] or '-'), balance=c['balance_str'])
+        for i, c in enumerate(cur, 1)
+    ))
 
-    return render_template_string(TEMPLATE, page='dashboard', customers=customers, q=q)
+    resp = make_response(render_page('dashboard', rows_html=rows_html, q=q))
+    resp.set_etag(etag, weak=True)
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
 
 @app.route('/add_customer', methods=['POST'])
 def add_customer():
@@ -392,7 +531,7 @@ def add_customer():
         return redirect(url_for('index'))
     db = get_db()
     db.execute('INSERT INTO customers (name, phone) VALUES (?, ?)', (name, phone or None))
-    db.commit()
+    bump_data_version()
     flash('Customer added')
     return redirect(url_for('index'))
 
@@ -401,24 +540,21 @@ def delete_customer(cust_id):
     if not require_login():
         return "Forbidden", 403
     db = get_db()
-    db.execute('DELETE FROM transactions WHERE customer_id = ?', (cust_id,))
     db.execute('DELETE FROM customers WHERE id = ?', (cust_id,))
-    db.commit()
+    bump_data_version()
     flash('Customer and transactions deleted')
     return redirect(url_for('index'))
 
 @app.route('/customer/<int:cust_id>')
 def customer_detail(cust_id):
     db = get_db()
-    cur = db.execute('SELECT id, name, phone FROM customers WHERE id = ?', (cust_id,))
-    r = cur.fetchone()
-    if not r:
+    cur = db.execute(f"SELECT id, name, phone, {BALANCE_STR_SQL} FROM customers WHERE id = ?", (cust_id,))
+    customer = cur.fetchone()
+    if not customer:
         return 'Not found', 404
-    customer = dict(r)
-    customer['balance'] = compute_balance(db, cust_id)
-    tx = db.execute('SELECT id, amount, type, note, created_at FROM transactions WHERE customer_id = ? ORDER BY created_at DESC', (cust_id,))
-    txns = [dict(t) for t in tx.fetchall()]
-    return render_template_string(TEMPLATE, page='customer', customer=customer, txns=txns)
+    tx = db.execute("SELECT id, printf('%.2f', amount) AS amount_str, type, note, created_at FROM transactions WHERE customer_id = ? ORDER BY created_at DESC", (cust_id,))
+    txns = tx.fetchall()
+    return render_page('customer', customer=customer, txns=txns)
 
 @app.route('/customer/<int:cust_id>/add_txn', methods=['POST'])
 def add_transaction(cust_id):
@@ -434,35 +570,67 @@ def add_transaction(cust_id):
         ttype = 'debit'
     note = request.form.get('note', '').strip()
     now = datetime.utcnow().isoformat()
+    delta = abs(amount) if ttype == 'debit' else -abs(amount)
     db = get_db()
-    db.execute('INSERT INTO transactions (customer_id, amount, type, note, created_at) VALUES (?,?,?,?,?)', (cust_id, abs(amount), ttype, note or None, now))
-    db.commit()
+    try:
+        with write_transaction(db):
+            db.execute('INSERT INTO transactions (customer_id, amount, type, note, created_at) VALUES (?,?,?,?,?)', (cust_id, abs(amount), ttype, note or None, now))
+            db.execute('UPDATE customers SET balance = balance + ? WHERE id = ?', (delta, cust_id))
+    except sqlite3.IntegrityError:
+        return 'Not found', 404
+    bump_data_version()
     flash('Transaction added')
     return redirect(url_for('customer_detail', cust_id=cust_id))
 
-@app.route('/export/<what>.csv')
-def export_csv(what):
-    db = get_db()
+# One CSV line per transaction, assembled and quoted by SQLite so the export loop does no per-field work
+TXN_CSV_LINE_SQL = """
+    id || ',' || customer_id || ',' || printf('%.2f', amount)
+    || ',"' || replace(type, '"', '""') || '"'
+    || ',' || COALESCE('"' || replace(note, '"', '""') || '"', '')
+    || ',"' || replace(created_at, '"', '""') || '"'
+"""
+
+
+def csv_lines(rows):
     si = StringIO()
     writer = csv.writer(si)
-    if what == 'customers':
-        cur = db.execute('SELECT id, name, phone FROM customers ORDER BY id DESC')
-        writer.writerow(['id', 'name', 'phone', 'balance'])
-        for r in cur.fetchall():
-            bal = compute_balance(db, r['id'])
-            writer.writerow([r['id'], r['name'], r['phone'] or '', '%.2f' % bal])
-    elif what == 'transactions':
-        customer_id = request.args.get('customer_id')
-        if customer_id:
-            cur = db.execute('SELECT id, customer_id, amount, type, note, created_at FROM transactions WHERE customer_id = ? ORDER BY created_at DESC', (customer_id,))
-        else:
-            cur = db.execute('SELECT id, customer_id, amount, type, note, created_at FROM transactions ORDER BY created_at DESC')
-        writer.writerow(['id', 'customer_id', 'amount', 'type', 'note', 'created_at'])
-        for r in cur.fetchall():
-            writer.writerow([r['id'], r['customer_id'], '%.2f' % r['amount'], r['type'], r['note'] or '', r['created_at']])
-    else:
+    for row in rows:
+        si.seek(0)
+        si.truncate()
+        writer.writerow(row)
+        yield si.getvalue()
+
+
+@app.route('/export/<what>.csv')
+def export_csv(what):
+    if what not in ('customers', 'transactions'):
         return 'Not found', 404
-    return Response(si.getvalue(), mimetype='text/csv', headers={"Content-Disposition": f"attachment;filename={what}.csv"})
+    customer_id = request.args.get('customer_id')
+
+    def generate():
+        # The export owns its connection for as long as the body streams: the request's get_db()
+        # one is closed by teardown first. Rows are pulled from the cursor one at a time, so memory
+        # stays flat for large exports.
+        db = connect_db()
+        try:
+            if what == 'customers':
+                cur = db.execute(f"SELECT id, name, phone, {BALANCE_STR_SQL} FROM customers ORDER BY id DESC")
+                yield from csv_lines(itertools.chain(
+                    [['id', 'name', 'phone', 'balance']],
+                    ([r['id'], r['name'], r['phone'] or '', r['balance_str']] for r in cur),
+                ))
+            else:
+                if customer_id:
+                    cur = db.execute(f"SELECT {TXN_CSV_LINE_SQL} FROM transactions WHERE customer_id = ? ORDER BY created_at DESC", (customer_id,))
+                else:
+                    cur = db.execute(f"SELECT {TXN_CSV_LINE_SQL} FROM transactions ORDER BY created_at DESC")
+                yield 'id,customer_id,amount,type,note,created_at\r\n'
+                for r in cur:
+                    yield r[0] + '\r\n'
+        finally:
+            db.close()
+
+    return Response(generate(), mimetype='text/csv', headers={"Content-Disposition": f"attachment;filename={what}.csv"})
 
 @app.route('/import', methods=['POST'])
 def import_csv():
@@ -472,29 +640,52 @@ def import_csv():
     if not f:
         flash('No file uploaded')
         return redirect(url_for('index'))
-    stream = StringIO(f.stream.read().decode('utf-8'))
-    reader = csv.DictReader(stream)
+    # decode and parse the upload incrementally instead of reading it all into memory
+    reader = csv.DictReader(TextIOWrapper(f.stream, encoding='utf-8', newline=''))
     db = get_db()
     added = 0
-    for row in reader:
-        if 'name' in row:
-            name = (row.get('name') or '').strip()
-            phone = (row.get('phone') or '').strip()
-            if name:
-                db.execute('INSERT INTO customers (name, phone) VALUES (?, ?)', (name, phone or None))
-                added += 1
-        elif 'customer_id' in row and 'amount' in row:
-            try:
-                cid = int(row.get('customer_id'))
-                amt = float(row.get('amount') or 0)
-                ttype = (row.get('type') or 'debit')
-                note = (row.get('note') or '')
-                created_at = row.get('created_at') or datetime.utcnow().isoformat()
-                db.execute('INSERT INTO transactions (customer_id, amount, type, note, created_at) VALUES (?,?,?,?,?)', (cid, abs(amt), ttype, note or None, created_at))
-                added += 1
-            except Exception:
-                continue
-    db.commit()
+    cust_batch = []
+    txn_batch = []
+    balance_batch = []
+
+    def flush():
+        nonlocal added
+        if cust_batch:
+            added += db.executemany('INSERT INTO customers (name, phone) VALUES (?, ?)', cust_batch).rowcount
+            cust_batch.clear()
+        if txn_batch:
+            # rows for unknown customers are skipped rather than failing the foreign key
+            added += db.executemany(
+                'INSERT INTO transactions (customer_id, amount, type, note, created_at) '
+                'SELECT ?,?,?,?,? WHERE EXISTS (SELECT 1 FROM customers WHERE id = ?)',
+                txn_batch,
+            ).rowcount
+            db.executemany('UPDATE customers SET balance = balance + ? WHERE id = ?', balance_batch)
+            txn_batch.clear()
+            balance_batch.clear()
+
+    with write_transaction(db):
+        for row in reader:
+            if 'name' in row:
+                name = (row.get('name') or '').strip()
+                phone = (row.get('phone') or '').strip()
+                if name:
+                    cust_batch.append((name, phone or None))
+            elif 'customer_id' in row and 'amount' in row:
+                try:
+                    cid = int(row.get('customer_id'))
+                    amt = float(row.get('amount') or 0)
+                    ttype = (row.get('type') or 'debit')
+                    note = (row.get('note') or '')
+                    created_at = row.get('created_at') or datetime.utcnow().isoformat()
+                    txn_batch.append((cid, abs(amt), ttype, note or None, created_at, cid))
+                    balance_batch.append((abs(amt) if ttype == 'debit' else -abs(amt), cid))
+                except Exception:
+                    continue
+            if len(cust_batch) + len(txn_batch) >= IMPORT_BATCH_SIZE:
+                flush()
+        flush()
+    bump_data_version()
     flash(f'Imported {added} rows')
     return redirect(url_for('index'))
 